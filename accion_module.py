@@ -4,10 +4,175 @@ Incluye obtención de datos en tiempo real de Yahoo Finance.
 """
 
 import yfinance as yf
+import numpy as np
 import pandas as pd
-from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from datetime import date, datetime
 from typing import Dict, List, Tuple, Optional
 import streamlit as st
+from cache_module import obtener_cache_disco
+from mercado_module import obtener_cierres_ytd
+
+try:
+    import requests_cache
+except ImportError:
+    requests_cache = None
+
+try:
+    import httpx
+except ImportError:
+    httpx = None
+
+import asyncio
+import logging
+import requests
+
+# Logger de módulo con formato perezoso: no construye el mensaje si el nivel
+# está silenciado, al contrario que los print() con f-string
+logger = logging.getLogger(__name__)
+
+@lru_cache(maxsize=4)
+def _fechas_hoy_inicio_ano(ordinal: int) -> Tuple[str, str]:
+    """Fechas ISO de hoy y del 1 de enero, cacheadas por día (clave: ordinal)."""
+    hoy = date.fromordinal(ordinal)
+    return hoy.isoformat(), date(hoy.year, 1, 1).isoformat()
+
+def fechas_hoy_inicio_ano() -> Tuple[str, str]:
+    """Devuelve (hoy, inicio de año) en formato ISO sin pasar por strftime."""
+    return _fechas_hoy_inicio_ano(date.today().toordinal())
+
+# Endpoint de gráficos de Yahoo: devuelve la serie de cierres de un ticker
+YF_CHART_URL = 'https://query1.finance.yahoo.com/v8/finance/chart/{}'
+
+# Endpoint spark de Yahoo: cotizaciones de hasta 20 símbolos por petición
+YF_SPARK_URL = 'https://query1.finance.yahoo.com/v8/finance/spark'
+
+def _spark_batch(tickers: List[str]) -> Dict[str, Tuple[float, float]]:
+    """
+    Obtiene precio actual y cierre anterior de varios tickers por lotes.
+
+    El endpoint spark admite hasta 20 símbolos por petición, así que una
+    cartera de 40 valores se refresca con 2 peticiones HTTP en vez de 40.
+
+    Args:
+        tickers: Lista de símbolos de Yahoo Finance
+
+    Returns:
+        Diccionario ticker -> (precio_actual, precio_cierre_anterior)
+    """
+    resultados = {}
+
+    for i in range(0, len(tickers), 20):
+        lote = tickers[i:i + 20]
+        try:
+            respuesta = requests.get(
+                YF_SPARK_URL,
+                params={'symbols': ','.join(lote), 'range': '5d', 'interval': '1d'},
+                headers={'User-Agent': 'Mozilla/5.0'},
+                timeout=10
+            )
+            if respuesta.status_code != 200:
+                continue
+
+            for resultado in respuesta.json().get('spark', {}).get('result', []):
+                try:
+                    cierres = resultado['response'][0]['indicators']['quote'][0]['close']
+                    cierres = [c for c in cierres if c is not None]
+                    if not cierres:
+                        continue
+                    actual = cierres[-1]
+                    anterior = cierres[-2] if len(cierres) > 1 else actual
+                    resultados[resultado['symbol']] = (actual, anterior)
+                except (KeyError, IndexError, TypeError):
+                    continue
+        except Exception as e:
+            logger.warning("Error en la petición spark para %d tickers: %s", len(lote), e)
+
+    return resultados
+
+async def _descargar_cierres_async(tickers: List[str]) -> Dict[str, List]:
+    """
+    Descarga las series de cierre YTD de varios tickers en paralelo.
+
+    Multiplexa las peticiones sobre un único cliente httpx asíncrono, lo que
+    amortiza el handshake TLS frente a una conexión por ticker.
+
+    Args:
+        tickers: Lista de símbolos de Yahoo Finance
+
+    Returns:
+        Diccionario ticker -> lista de cierres (puede omitir tickers con error)
+    """
+    limits = httpx.Limits(max_connections=16)
+    headers = {'User-Agent': 'Mozilla/5.0'}
+
+    async with httpx.AsyncClient(limits=limits, headers=headers, timeout=10) as client:
+        respuestas = await asyncio.gather(
+            *[client.get(YF_CHART_URL.format(t), params={'range': 'ytd', 'interval': '1d'})
+              for t in tickers],
+            return_exceptions=True
+        )
+
+    cierres = {}
+    for ticker, respuesta in zip(tickers, respuestas):
+        if isinstance(respuesta, Exception) or respuesta.status_code != 200:
+            continue
+        try:
+            resultado = respuesta.json()['chart']['result'][0]
+            cierres[ticker] = resultado['indicators']['quote'][0]['close']
+        except (KeyError, IndexError, TypeError):
+            continue
+    return cierres
+
+# Mapeo de campos internos a cabeceras de la tabla de acciones
+COLUMN_MAP_ACCIONES = {
+    'id': 'ID',
+    'nombre': 'Nombre',
+    'ticker': 'Ticker',
+    'sector': 'Sector',
+    'precio_compra': 'Precio de compra',
+    'num_acciones': 'Número de acciones',
+    'valor_actual': 'Valor actual',
+    'cambio_diario_eur': 'Cambio diario (€)',
+    'cambio_diario_pct': 'Cambio diario (%)',
+    'cambio_ytd_pct': 'Cambio YTD (%)',
+    'ganancia_total_eur': 'Ganancias/pérdidas (€)',
+    'ganancia_total_pct': 'Ganancias/pérdidas (%)',
+    'fecha_compra': 'Fecha de compra',
+    'total_invertido': 'Total invertido',
+    'valor_actual_total': 'Valor actual total'
+}
+
+# Dtypes declarados de las columnas numéricas: evita que pandas tenga que
+# inferirlos escaneando cada valor al construir el DataFrame
+ACCION_DTYPES = {
+    'Precio de compra': 'float64',
+    'Número de acciones': 'float64',
+    'Valor actual': 'float64',
+    'Cambio diario (€)': 'float64',
+    'Cambio diario (%)': 'float64',
+    'Cambio YTD (%)': 'float64',
+    'Ganancias/pérdidas (€)': 'float64',
+    'Ganancias/pérdidas (%)': 'float64',
+    'Total invertido': 'float64',
+    'Valor actual total': 'float64'
+}
+
+# Sesión HTTP compartida con caché en disco (SQLite): las respuestas de Yahoo
+# se reutilizan entre reruns de Streamlit e incluso entre reinicios del proceso
+_session = None
+
+def obtener_session():
+    """Devuelve la sesión HTTP cacheada compartida, o None si no está disponible."""
+    global _session
+    if _session is None and requests_cache is not None:
+        _session = requests_cache.CachedSession(
+            cache_name='yf_cache',
+            backend='sqlite',
+            expire_after=300
+        )
+    return _session
 
 class AccionManager:
     """Gestor de operaciones relacionadas con acciones."""
@@ -16,142 +181,404 @@ class AccionManager:
         """Inicializa el gestor de acciones."""
         self.db = db_manager
         self.cache = {}
-    
-    @st.cache_data(ttl=300)  # Cache de 5 minutos
-    def obtener_datos_mercado(_self, ticker: str) -> Optional[Dict]:
+        self.session = obtener_session()
+        self.disk_cache = obtener_cache_disco()
+
+    def _prefetch_mercado(self, tickers: List[str]) -> None:
         """
-        Obtiene datos en tiempo real de Yahoo Finance para una acción.
-        
+        Descarga en una sola llamada los datos de mercado de varios tickers.
+
+        Usa yf.download con group_by='ticker' para evitar una petición HTTP
+        por símbolo; los resultados se guardan en self.cache para que
+        obtener_datos_mercado los reutilice.
+
         Args:
-            ticker: Símbolo de la acción en Yahoo Finance
-        
-        Returns:
-            Diccionario con datos de mercado o None si hay error
+            tickers: Lista de símbolos de Yahoo Finance
+        """
+        pendientes = [t for t in tickers if t not in self.cache]
+        if not pendientes:
+            return
+
+        # Vía más rápida: spark da los precios de 20 tickers por petición y el
+        # ancla YTD ya está cacheada a diario, así que el refresco intradía
+        # no descarga histórico alguno
+        precios_spark = _spark_batch(pendientes)
+        if precios_spark:
+            try:
+                ano = datetime.now().year
+                # Anclas YTD resueltas en una sola descarga por lotes, con la
+                # petición individual como respaldo para los tickers ausentes
+                anclas = self._precios_inicio_ano_batch(tuple(sorted(precios_spark)), ano)
+                # Nombre y sector reales en lugar de un marcador: si no, la vía
+                # por lotes machacaba los valores de la BD al fusionar métricas
+                estaticos = self._info_estatica_batch(tuple(sorted(precios_spark)))
+                for ticker, (precio_actual, precio_cierre_anterior) in precios_spark.items():
+                    precio_inicio_ano = anclas.get(ticker) or self._precio_inicio_ano(ticker, ano)
+                    # `not` descarta también un ancla 0.0, que rompería la división
+                    if not precio_inicio_ano:
+                        continue
+
+                    estatico = estaticos.get(ticker) or {'nombre': ticker, 'sector': 'No disponible'}
+                    cambio_diario_eur = precio_actual - precio_cierre_anterior
+                    self.cache[ticker] = {
+                        'nombre': estatico['nombre'],
+                        'ticker': ticker,
+                        'sector': estatico['sector'],
+                        'valor_actual': round(precio_actual, 2),
+                        'cambio_diario_eur': round(cambio_diario_eur, 2),
+                        'cambio_diario_pct': round(cambio_diario_eur / precio_cierre_anterior * 100, 2) if precio_cierre_anterior else 0,
+                        'cambio_ytd_pct': round((precio_actual - precio_inicio_ano) / precio_inicio_ano * 100, 2)
+                    }
+
+                pendientes = [t for t in pendientes if t not in self.cache]
+                if not pendientes:
+                    self._calcular_core.cache_clear()
+                    return
+            except Exception as e:
+                logger.warning("Error en la vía spark de %d tickers: %s", len(precios_spark), e)
+
+        cierres = None
+
+        # Vía rápida: peticiones asíncronas multiplexadas con httpx
+        if httpx is not None:
+            try:
+                cierres_map = asyncio.run(_descargar_cierres_async(pendientes))
+                if cierres_map:
+                    cierres = pd.DataFrame({t: pd.Series(v) for t, v in cierres_map.items()})
+            except Exception as e:
+                logger.warning("Error en la descarga asíncrona, usando yf.download: %s", e)
+
+        try:
+            if cierres is None:
+                hoy, inicio_ano = fechas_hoy_inicio_ano()
+                # Descarga compartida con el módulo de fondos: si ambos
+                # gestores piden el mismo lote en la ventana de caché, solo
+                # el primero paga la petición
+                cierres = obtener_cierres_ytd(tuple(sorted(pendientes)), inicio_ano, hoy)
+
+                if cierres.empty:
+                    return
+
+            # Rellenar huecos de cotización antes de operar
+            cierres = cierres.ffill()
+
+            # Los tres precios de referencia y los cambios se calculan como
+            # Series vectorizadas sobre todos los tickers a la vez
+            precio_actual = cierres.iloc[-1]
+            precio_cierre_anterior = cierres.iloc[-2] if len(cierres) > 1 else precio_actual
+            precio_inicio_ano = cierres.bfill().iloc[0]
+
+            cambio_diario_eur = (precio_actual - precio_cierre_anterior).round(2)
+            cambio_diario_pct = ((precio_actual - precio_cierre_anterior) / precio_cierre_anterior * 100).round(2)
+            cambio_ytd_pct = ((precio_actual - precio_inicio_ano) / precio_inicio_ano * 100).round(2)
+            valor_actual = precio_actual.round(2)
+
+            # Metadatos reales resueltos por lotes (caché semanal + disco)
+            estaticos = self._info_estatica_batch(tuple(sorted(pendientes)))
+
+            for ticker in pendientes:
+                if ticker not in valor_actual.index or pd.isna(valor_actual[ticker]):
+                    continue
+
+                estatico = estaticos.get(ticker) or {'nombre': ticker, 'sector': 'No disponible'}
+                self.cache[ticker] = {
+                    'nombre': estatico['nombre'],
+                    'ticker': ticker,
+                    'sector': estatico['sector'],
+                    'valor_actual': valor_actual[ticker],
+                    'cambio_diario_eur': cambio_diario_eur[ticker],
+                    'cambio_diario_pct': cambio_diario_pct[ticker],
+                    'cambio_ytd_pct': cambio_ytd_pct[ticker]
+                }
+
+            # Con precios nuevos, las métricas memoizadas quedan obsoletas
+            self._calcular_core.cache_clear()
+        except Exception as e:
+            logger.warning("Error en la descarga por lotes de %d tickers: %s", len(pendientes), e)
+
+    @st.cache_data(ttl=604800)  # 7 días, igual que los metadatos individuales
+    def _info_estatica_batch(_self, tickers: Tuple[str, ...]) -> Dict[str, Dict]:
+        """
+        Obtiene en paralelo los metadatos estáticos de varios tickers.
+
+        Las consultas son de E/S pura y casi siempre resueltas por la caché
+        semanal en disco, así que el abanico de hilos deja el lote completo
+        en aproximadamente un viaje cuando hay que salir a la red.
         """
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            return dict(zip(tickers, executor.map(_self._obtener_info_estatico, tickers)))
+
+    @st.cache_data(ttl=604800)  # 7 días: el nombre y el sector no cambian
+    def _obtener_info_estatico(_self, ticker: str) -> Dict:
+        """Obtiene los metadatos estáticos (nombre, sector) de una acción."""
         try:
-            accion = yf.Ticker(ticker)
-            
-            # Obtener información básica
-            info = accion.info
-            
-            # Obtener datos históricos para YTD
-            hoy = datetime.now()
-            inicio_ano = datetime(hoy.year, 1, 1)
-            historico = accion.history(start=inicio_ano.strftime('%Y-%m-%d'), 
-                                      end=hoy.strftime('%Y-%m-%d'))
-            
-            if historico.empty:
-                return None
-            
-            # Calcular cambios
-            precio_actual = info.get('regularMarketPrice', 
-                                   info.get('currentPrice', 
-                                          historico['Close'].iloc[-1] if not historico.empty else 0))
-            
-            precio_cierre_anterior = info.get('regularMarketPreviousClose', 
-                                            historico['Close'].iloc[-2] if len(historico) > 1 else precio_actual)
-            
-            precio_inicio_ano = historico['Close'].iloc[0] if not historico.empty else precio_actual
-            
-            cambio_diario_pct = ((precio_actual - precio_cierre_anterior) / precio_cierre_anterior * 100) 
-            cambio_diario_eur = precio_actual - precio_cierre_anterior
-            
-            cambio_ytd_pct = ((precio_actual - precio_inicio_ano) / precio_inicio_ano * 100) 
-            
-            return {
+            # La caché en disco evita repetir la descarga tras un reinicio
+            cacheado = _self.disk_cache.obtener(ticker, 'info_estatico', ttl=604800)
+            if cacheado is not None:
+                return cacheado
+
+            info = yf.Ticker(ticker, session=_self.session).info
+            estatico = {
                 'nombre': info.get('longName', ticker),
-                'ticker': ticker,
-                'sector': info.get('sector', 'No disponible'),
-                'valor_actual': round(precio_actual, 2),
-                'cambio_diario_eur': round(cambio_diario_eur, 2),
-                'cambio_diario_pct': round(cambio_diario_pct, 2),
-                'cambio_ytd_pct': round(cambio_ytd_pct, 2)
+                'sector': info.get('sector', 'No disponible')
+            }
+            _self.disk_cache.guardar(ticker, 'info_estatico', estatico)
+            return estatico
+        except Exception as e:
+            logger.warning("Error al obtener info estática para %s: %s", ticker, e)
+            return {'nombre': ticker, 'sector': 'No disponible'}
+
+    # TTL largo: la invalidación real llega vía st.cache_data.clear() cuando
+    # el usuario escribe en la cartera o pulsa "Actualizar Datos"
+    @st.cache_data(ttl=3600)
+    def _obtener_precio_vivo(_self, ticker: str) -> Optional[Dict]:
+        """Obtiene el último precio y el cierre anterior vía fast_info."""
+        try:
+            cacheado = _self.disk_cache.obtener(ticker, 'precios', ttl=60)
+            if cacheado is not None:
+                return cacheado
+
+            # fast_info solo descarga los campos de cotización, no el blob
+            # completo de quoteSummary que trae .info
+            fast_info = yf.Ticker(ticker, session=_self.session).fast_info
+            precios = {
+                'precio_actual': fast_info.last_price,
+                'precio_cierre_anterior': fast_info.previous_close
             }
-            
+            _self.disk_cache.guardar(ticker, 'precios', precios)
+            return precios
+        except Exception as e:
+            logger.warning("Error al obtener precio para %s: %s", ticker, e)
+            return None
+
+    @st.cache_data(ttl=86400)  # 24 horas, igual que el ancla individual
+    def _precios_inicio_ano_batch(_self, tickers: Tuple[str, ...], ano: int) -> Dict[str, float]:
+        """
+        Obtiene los primeros cierres del año de varios tickers de una vez.
+
+        Sustituye N peticiones .history() secuenciales por una sola descarga
+        por lotes cuando la caché diaria está fría.
+        """
+        try:
+            historico = yf.download(
+                tickers=" ".join(tickers),
+                start=f'{ano}-01-01',
+                end=f'{ano}-01-15',
+                group_by='ticker',
+                threads=True,
+                progress=False
+            )
+            if historico.empty:
+                return {}
+
+            if len(tickers) > 1:
+                cierres = historico.xs('Close', axis=1, level=1)
+            else:
+                cierres = historico[['Close']].rename(columns={'Close': tickers[0]})
+
+            primeros = cierres.bfill().iloc[0]
+            return {t: float(v) for t, v in primeros.items() if pd.notna(v)}
         except Exception as e:
-            print(f"Error al obtener datos para {ticker}: {e}")
+            logger.warning("Error en la descarga por lotes de anclas YTD: %s", e)
+            return {}
+
+    @st.cache_data(ttl=86400)  # 24 horas: el precio de inicio de año es constante
+    def _precio_inicio_ano(_self, ticker: str, ano: int) -> Optional[float]:
+        """Obtiene el primer cierre del año, ancla del cambio YTD."""
+        try:
+            historico = yf.Ticker(ticker, session=_self.session).history(
+                start=f'{ano}-01-01', end=f'{ano}-01-15')
+            # .iat evita crear objetos slice intermedios en el acceso escalar
+            return float(historico['Close'].iat[0]) if len(historico) else None
+        except Exception as e:
+            logger.warning("Error al obtener precio de inicio de año para %s: %s", ticker, e)
+            return None
+
+    @st.cache_data(ttl=60)  # Ventana corta solo para el cambio diario
+    def _obtener_historico_5d(_self, ticker: str) -> Optional[np.ndarray]:
+        """Obtiene los cierres de los últimos 5 días como array de NumPy."""
+        try:
+            historico = yf.Ticker(ticker, session=_self.session).history(period='5d')
+            # Solo se leen escalares del cierre: el ndarray evita arrastrar el
+            # índice de Timestamps y el resto de columnas del DataFrame
+            return historico['Close'].to_numpy() if len(historico) else None
+        except Exception as e:
+            logger.warning("Error al obtener histórico para %s: %s", ticker, e)
             return None
+
+    def obtener_datos_mercado(self, ticker: str, force_refresh: bool = False) -> Optional[Dict]:
+        """
+        Obtiene datos en tiempo real de Yahoo Finance para una acción.
+
+        Combina tres cachés con TTL alineado a la cadencia de cada dato:
+        metadatos (semanal), histórico YTD (12 h) y precios (invalidados
+        al escribir en la cartera).
+
+        Args:
+            ticker: Símbolo de la acción en Yahoo Finance
+            force_refresh: Si True, descarta los precios cacheados del ticker
+
+        Returns:
+            Diccionario con datos de mercado o None si hay error
+        """
+        if force_refresh:
+            self.cache.pop(ticker, None)
+            self._obtener_precio_vivo.clear()
+            self._calcular_core.cache_clear()
+
+        # Reutilizar datos precargados por _prefetch_mercado si existen
+        if ticker in self.cache:
+            return self.cache[ticker]
+
+        precios = self._obtener_precio_vivo(ticker) or {}
+        precio_actual = precios.get('precio_actual')
+        precio_cierre_anterior = precios.get('precio_cierre_anterior')
+
+        # Solo si fast_info no da precios se recurre al histórico, y bastan
+        # 5 días de cotizaciones: el ancla YTD viene de _precio_inicio_ano
+        if precio_actual is None:
+            cierres = self._obtener_historico_5d(ticker)
+            if cierres is None:
+                return None
+            precio_actual = float(cierres[-1])
+            if precio_cierre_anterior is None:
+                precio_cierre_anterior = float(cierres[-2]) if len(cierres) > 1 else precio_actual
+
+        if precio_cierre_anterior is None:
+            precio_cierre_anterior = precio_actual
+
+        # El ancla YTD es constante durante todo el año, así que se cachea
+        # a diario y el refresco intradía no descarga histórico alguno
+        precio_inicio_ano = self._precio_inicio_ano(ticker, datetime.now().year) or precio_actual
+
+        cambio_diario_pct = ((precio_actual - precio_cierre_anterior) / precio_cierre_anterior * 100)
+        cambio_diario_eur = precio_actual - precio_cierre_anterior
+
+        cambio_ytd_pct = ((precio_actual - precio_inicio_ano) / precio_inicio_ano * 100)
+
+        estatico = self._obtener_info_estatico(ticker)
+
+        return {
+            'nombre': estatico['nombre'],
+            'ticker': ticker,
+            'sector': estatico['sector'],
+            'valor_actual': round(precio_actual, 2),
+            'cambio_diario_eur': round(cambio_diario_eur, 2),
+            'cambio_diario_pct': round(cambio_diario_pct, 2),
+            'cambio_ytd_pct': round(cambio_ytd_pct, 2)
+        }
     
+    @lru_cache(maxsize=1024)
+    def _calcular_core(self, ticker: str, precio_compra: float, num_acciones: float) -> Dict:
+        """
+        Núcleo memoizable del cálculo de métricas, con clave hashable.
+
+        El LRU se vacía desde _prefetch_mercado cuando llegan datos frescos,
+        de modo que los reruns con entradas idénticas no recalculan nada.
+        """
+        datos_mercado = self.obtener_datos_mercado(ticker)
+
+        if not datos_mercado:
+            # Usar valores por defecto si no se pueden obtener datos
+            datos_mercado = {
+                'valor_actual': 0,
+                'cambio_diario_eur': 0,
+                'cambio_diario_pct': 0,
+                'cambio_ytd_pct': 0,
+                'sector': 'No disponible'
+            }
+
+        valor_actual = datos_mercado['valor_actual']
+
+        # Cálculos de ganancias/pérdidas
+        ganancia_total_eur = (valor_actual - precio_compra) * num_acciones
+        ganancia_total_pct = ((valor_actual - precio_compra) / precio_compra * 100) if precio_compra > 0 else 0
+
+        total_invertido = precio_compra * num_acciones
+        valor_actual_total = valor_actual * num_acciones
+
+        return {
+            **datos_mercado,
+            'ganancia_total_eur': round(ganancia_total_eur, 2),
+            'ganancia_total_pct': round(ganancia_total_pct, 2),
+            'total_invertido': round(total_invertido, 2),
+            'valor_actual_total': round(valor_actual_total, 2)
+        }
+
     def calcular_metricas_accion(self, accion_data: Dict) -> Dict:
         """
         Calcula todas las métricas para una acción.
-        
+
         Args:
             accion_data: Datos de la acción desde la base de datos
-        
+
         Returns:
             Diccionario con todas las métricas calculadas
         """
         try:
-            datos_mercado = self.obtener_datos_mercado(accion_data['ticker'])
-            
-            if not datos_mercado:
-                # Usar valores por defecto si no se pueden obtener datos
-                datos_mercado = {
-                    'valor_actual': accion_data.get('valor_actual', 0),
-                    'cambio_diario_eur': 0,
-                    'cambio_diario_pct': 0,
-                    'cambio_ytd_pct': 0,
-                    'sector': 'No disponible'
-                }
-            
-            precio_compra = accion_data.get('precio_compra', 0)
-            num_acciones = accion_data.get('num_acciones', 0)
-            valor_actual = datos_mercado['valor_actual']
-            
-            # Cálculos de ganancias/pérdidas
-            ganancia_total_eur = (valor_actual - precio_compra) * num_acciones
-            ganancia_total_pct = ((valor_actual - precio_compra) / precio_compra * 100) if precio_compra > 0 else 0
-            
-            total_invertido = precio_compra * num_acciones
-            valor_actual_total = valor_actual * num_acciones
-            
-            return {
-                **accion_data,
-                **datos_mercado,
-                'ganancia_total_eur': round(ganancia_total_eur, 2),
-                'ganancia_total_pct': round(ganancia_total_pct, 2),
-                'total_invertido': round(total_invertido, 2),
-                'valor_actual_total': round(valor_actual_total, 2)
-            }
-            
+            core = self._calcular_core(
+                accion_data['ticker'],
+                accion_data.get('precio_compra', 0),
+                accion_data.get('num_acciones', 0)
+            )
+            return {**accion_data, **core}
+
         except Exception as e:
-            print(f"Error al calcular métricas para acción {accion_data.get('ticker', '')}: {e}")
+            logger.warning("Error al calcular métricas para acción %s: %s", accion_data.get('ticker', ''), e)
             return accion_data
     
-    def obtener_todas_acciones_con_metricas(self) -> Tuple[List[Dict], Dict]:
+    def obtener_todas_acciones_con_metricas(self, max_workers: int = 8) -> Tuple[List[Dict], Dict]:
         """
         Obtiene todas las acciones con sus métricas calculadas.
-        
+
+        Args:
+            max_workers: Número máximo de hilos para las descargas de mercado
+
         Returns:
             Tuple: (lista de acciones, diccionario de totales)
         """
         acciones_db = self.db.obtener_acciones()
-        acciones_calculadas = []
-        
-        total_invertido = 0
-        valor_actual_total = 0
-        ganancia_total_eur = 0
-        
-        for accion in acciones_db:
-            accion_con_metricas = self.calcular_metricas_accion(accion)
-            acciones_calculadas.append(accion_con_metricas)
-            
-            # Acumular totales
-            total_invertido += accion_con_metricas.get('total_invertido', 0)
-            valor_actual_total += accion_con_metricas.get('valor_actual_total', 0)
-            ganancia_total_eur += accion_con_metricas.get('ganancia_total_eur', 0)
-        
+
+        # Cartera vacía: no hay nada que descargar ni que sumar
+        if not acciones_db:
+            return [], {
+                'total_invertido': 0,
+                'valor_actual_total': 0,
+                'ganancia_total_eur': 0,
+                'ganancia_total_pct': 0
+            }
+
+        # Precargar los datos de mercado una sola vez por ticker único:
+        # el mismo valor puede aparecer en varios lotes de compra
+        tickers_unicos = list(dict.fromkeys(a['ticker'] for a in acciones_db if a.get('ticker')))
+        self._prefetch_mercado(tickers_unicos)
+
+        # Los tickers que no entraron en la precarga se descargan en paralelo:
+        # el cuello de botella es la red, así que los hilos no compiten por el GIL
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            acciones_calculadas = list(executor.map(self.calcular_metricas_accion, acciones_db))
+
+        # Acumular totales con una única reducción vectorizada en lugar de
+        # sumar campo a campo en un bucle de Python
+        df_totales = pd.DataFrame(
+            acciones_calculadas,
+            columns=['total_invertido', 'valor_actual_total', 'ganancia_total_eur']
+        ).fillna(0)
+        sumas = df_totales.sum()
+
+        total_invertido = sumas['total_invertido']
+        ganancia_total_eur = sumas['ganancia_total_eur']
+
         # Calcular porcentaje total de ganancia
         ganancia_total_pct = (ganancia_total_eur / total_invertido * 100) if total_invertido > 0 else 0
-        
+
         totales = {
             'total_invertido': round(total_invertido, 2),
-            'valor_actual_total': round(valor_actual_total, 2),
+            'valor_actual_total': round(sumas['valor_actual_total'], 2),
             'ganancia_total_eur': round(ganancia_total_eur, 2),
             'ganancia_total_pct': round(ganancia_total_pct, 2)
         }
-        
+
         return acciones_calculadas, totales
     
     def crear_dataframe_acciones(self, acciones: List[Dict], totales: Dict) -> pd.DataFrame:
@@ -167,54 +594,27 @@ class AccionManager:
         """
         if not acciones:
             return pd.DataFrame()
-        
-        # Crear lista de filas para el DataFrame
-        filas = []
-        
-        for accion in acciones:
-            fila = {
-                'ID': accion.get('id', ''),
-                'Nombre': accion.get('nombre', ''),
-                'Ticker': accion.get('ticker', ''),
-                'Sector': accion.get('sector', 'No disponible'),
-                'Precio de compra': accion.get('precio_compra', 0),
-                'Número de acciones': accion.get('num_acciones', 0),
-                'Valor actual': accion.get('valor_actual', 0),
-                'Cambio diario (€)': accion.get('cambio_diario_eur', 0),
-                'Cambio diario (%)': accion.get('cambio_diario_pct', 0),
-                'Cambio YTD (%)': accion.get('cambio_ytd_pct', 0),
-                'Ganancias/pérdidas (€)': accion.get('ganancia_total_eur', 0),
-                'Ganancias/pérdidas (%)': accion.get('ganancia_total_pct', 0),
-                'Fecha de compra': accion.get('fecha_compra', ''),
-                'Total invertido': accion.get('total_invertido', 0),
-                'Valor actual total': accion.get('valor_actual_total', 0)
-            }
-            filas.append(fila)
-        
-        # Crear DataFrame
-        df = pd.DataFrame(filas)
-        
-        # Añadir fila de totales
-        if not df.empty:
-            fila_totales = {
-                'Nombre': '**TOTALES**',
-                'Ticker': '',
-                'Sector': '',
-                'Precio de compra': '',
-                'Número de acciones': '',
-                'Valor actual': '',
-                'Cambio diario (€)': '',
-                'Cambio diario (%)': '',
-                'Cambio YTD (%)': '',
-                'Ganancias/pérdidas (€)': totales['ganancia_total_eur'],
-                'Ganancias/pérdidas (%)': totales['ganancia_total_pct'],
-                'Fecha de compra': '',
-                'Total invertido': totales['total_invertido'],
-                'Valor actual total': totales['valor_actual_total']
-            }
-            
-            # Crear un DataFrame para la fila de totales y concatenar
-            df_totales = pd.DataFrame([fila_totales])
-            df = pd.concat([df, df_totales], ignore_index=True)
-        
+
+        # Construir el DataFrame de una vez desde los registros y renombrar
+        # las columnas, en lugar de montar un dict de Python por fila
+        df = pd.DataFrame.from_records(acciones) \
+            .reindex(columns=list(COLUMN_MAP_ACCIONES)) \
+            .rename(columns=COLUMN_MAP_ACCIONES) \
+            .astype(ACCION_DTYPES, copy=False)
+        df['Sector'] = df['Sector'].fillna('No disponible')
+
+        # Añadir fila de totales sin pasar por pd.concat. Solo las columnas de
+        # texto reciben cadenas vacías: las numéricas quedan en NaN para no
+        # degradar su dtype a object
+        df.loc[len(df)] = {
+            'Nombre': '**TOTALES**',
+            'Ticker': '',
+            'Sector': '',
+            'Fecha de compra': '',
+            'Ganancias/pérdidas (€)': totales['ganancia_total_eur'],
+            'Ganancias/pérdidas (%)': totales['ganancia_total_pct'],
+            'Total invertido': totales['total_invertido'],
+            'Valor actual total': totales['valor_actual_total']
+        }
+
         return df
@@ -0,0 +1,74 @@
+"""
+Módulo de caché persistente en disco para datos de mercado.
+A diferencia de st.cache_data, sobrevive a los reruns de Streamlit
+y a los reinicios del proceso.
+"""
+
+import json
+import sqlite3
+import threading
+import time
+from typing import Dict, Optional
+
+class AccionCache:
+    """Caché clave-valor en SQLite, con TTL por consulta, para datos de mercado."""
+
+    def __init__(self, ruta: str = '.mercado_cache.db'):
+        """Abre (o crea) la base de datos de caché en la ruta indicada."""
+        self.conn = sqlite3.connect(ruta, check_same_thread=False)
+        self.lock = threading.Lock()
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS cache ("
+            "ticker TEXT, endpoint TEXT, json TEXT, fetched_at REAL, "
+            "PRIMARY KEY (ticker, endpoint))"
+        )
+        self.conn.commit()
+
+    def obtener(self, ticker: str, endpoint: str, ttl: float) -> Optional[Dict]:
+        """
+        Recupera una entrada de la caché si no ha expirado.
+
+        Args:
+            ticker: Símbolo de Yahoo Finance
+            endpoint: Nombre lógico del dato cacheado (p.ej. 'precios')
+            ttl: Segundos de validez de la entrada
+
+        Returns:
+            Diccionario cacheado o None si no existe o ha expirado
+        """
+        try:
+            with self.lock:
+                fila = self.conn.execute(
+                    "SELECT json, fetched_at FROM cache WHERE ticker = ? AND endpoint = ?",
+                    (ticker, endpoint)
+                ).fetchone()
+
+            if fila is None or time.time() - fila[1] > ttl:
+                return None
+
+            return json.loads(fila[0])
+        except Exception as e:
+            print(f"Error al leer caché de {ticker}/{endpoint}: {e}")
+            return None
+
+    def guardar(self, ticker: str, endpoint: str, datos: Dict) -> None:
+        """Guarda (o reemplaza) una entrada en la caché."""
+        try:
+            with self.lock:
+                self.conn.execute(
+                    "INSERT OR REPLACE INTO cache VALUES (?, ?, ?, ?)",
+                    (ticker, endpoint, json.dumps(datos), time.time())
+                )
+                self.conn.commit()
+        except Exception as e:
+            print(f"Error al guardar caché de {ticker}/{endpoint}: {e}")
+
+# Instancia global compartida por los gestores de fondos y acciones
+_cache_disco = None
+
+def obtener_cache_disco() -> AccionCache:
+    """Obtiene la instancia global de la caché en disco."""
+    global _cache_disco
+    if _cache_disco is None:
+        _cache_disco = AccionCache()
+    return _cache_disco
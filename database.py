@@ -2,15 +2,66 @@
 Módulo de conexión y operaciones con Supabase para persistencia de datos.
 """
 
+import asyncio
 import os
-from typing import List, Dict, Optional, Any
-from supabase import create_client, Client
+from typing import List, Dict, Optional, Any, Tuple
+import httpx
+from supabase import create_client, Client, ClientOptions, acreate_client
 from dotenv import load_dotenv
 import pandas as pd
+import streamlit as st
+
+def _invalidar_caches():
+    """Invalida las cachés de datos tras una escritura en la cartera."""
+    try:
+        # Primero las lecturas de tabla de este módulo y después el resto de
+        # capas (las métricas cacheadas en app.py dependen de estos datos)
+        _leer_fondos.clear()
+        _leer_acciones.clear()
+        _leer_todo.clear()
+        st.cache_data.clear()
+    except Exception:
+        # Fuera de un contexto Streamlit (p.ej. scripts) no hay caché que limpiar
+        pass
+
+# Lecturas de tabla cacheadas: cada interacción con un widget relanza el
+# script y, sin esta capa, cada rerun repetiría el select completo contra
+# Supabase aunque los datos no hubieran cambiado. Ambas tablas se sirven
+# desde _leer_todo: quien pida solo una ya deja la otra caliente y la carga
+# en frío solapa las dos consultas
+@st.cache_data(ttl=60, show_spinner=False)
+def _leer_fondos() -> List[Dict]:
+    """Lee la tabla de fondos, cacheada entre reruns."""
+    return _leer_todo()[0]
+
+@st.cache_data(ttl=60, show_spinner=False)
+def _leer_acciones() -> List[Dict]:
+    """Lee la tabla de acciones, cacheada entre reruns."""
+    return _leer_todo()[1]
+
+@st.cache_data(ttl=60, show_spinner=False)
+def _leer_todo() -> Tuple[List[Dict], List[Dict]]:
+    """Lee fondos y acciones a la vez, cacheado entre reruns."""
+    return obtener_db_manager().obtener_todo()
 
 # Cargar variables de entorno
 load_dotenv()
 
+# Dtypes declarados de la tabla de fondos: el JSON de Supabase llega como
+# tipos de Python sueltos y esta única coerción en C evita que cada consumidor
+# vuelva a convertir los números por su cuenta
+FONDO_DTYPES = {
+    'id': 'int64',
+    'valor_compra': 'float64',
+    'cantidad': 'float64'
+}
+
+# Proyección de columnas de cada tabla: pedir solo lo que el dashboard usa
+# reduce los bytes por respuesta y el JSON a decodificar; si una función
+# futura necesita más columnas, se amplía aquí por tabla
+FONDO_COLS = "id,nombre,ticker,tipo_inversion,valor_compra,cantidad,fecha_compra"
+ACCION_COLS = "id,nombre,ticker,sector,precio_compra,num_acciones,fecha_compra"
+
 class DatabaseManager:
     """Gestor de operaciones de base de datos con Supabase."""
     
@@ -21,37 +72,55 @@ class DatabaseManager:
         
         if not self.url or not self.key:
             raise ValueError("SUPABASE_URL y SUPABASE_KEY deben estar definidos en las variables de entorno")
-        
-        self.client: Client = create_client(self.url, self.key)
+
+        # Cliente HTTP compartido con pool de conexiones keep-alive: se
+        # reutilizan las conexiones TCP/TLS entre peticiones en lugar de
+        # renegociar el handshake en cada consulta. Sin http2=True: exigiría
+        # el paquete h2, que no es dependencia, y la ganancia está en el pool
+        opciones = ClientOptions(
+            httpx_client=httpx.Client(
+                limits=httpx.Limits(max_connections=20, max_keepalive_connections=10)
+            )
+        )
+        self.client: Client = create_client(self.url, self.key, options=opciones)
     
     def obtener_fondos(self) -> List[Dict]:
         """Obtiene todos los fondos de inversión de la base de datos."""
         try:
-            response = self.client.table("fondos").select("*").execute()
-            return response.data
+            return _leer_fondos()
         except Exception as e:
             print(f"Error al obtener fondos: {e}")
             return []
     
-    def guardar_fondo(self, fondo_data: Dict) -> Dict:
-        """Guarda un nuevo fondo o actualiza uno existente."""
+    def obtener_fondos_df(self) -> pd.DataFrame:
+        """Obtiene los fondos como DataFrame con columnas tipadas."""
+        fondos = self.obtener_fondos()
+        if not fondos:
+            return pd.DataFrame()
+
+        df = pd.DataFrame.from_records(fondos)
+        presentes = {col: dtype for col, dtype in FONDO_DTYPES.items() if col in df.columns}
+        return df.astype(presentes, copy=False)
+
+    def guardar_fondos(self, fondos: List[Dict]) -> List[Dict]:
+        """Guarda varios fondos en una sola petición mediante upsert."""
         try:
-            if "id" in fondo_data and fondo_data["id"]:
-                # Actualizar fondo existente
-                response = self.client.table("fondos")\
-                    .update(fondo_data)\
-                    .eq("id", fondo_data["id"])\
-                    .execute()
-            else:
-                # Crear nuevo fondo
-                response = self.client.table("fondos")\
-                    .insert(fondo_data)\
-                    .execute()
-            
-            return response.data[0] if response.data else {}
+            # El INSERT .. ON CONFLICT lo resuelve PostgREST en el servidor:
+            # un único viaje HTTP tanto para altas como para actualizaciones
+            response = self.client.table("fondos")\
+                .upsert(fondos, on_conflict="id")\
+                .execute()
+
+            _invalidar_caches()
+            return response.data or []
         except Exception as e:
-            print(f"Error al guardar fondo: {e}")
-            return {}
+            print(f"Error al guardar fondos: {e}")
+            return []
+
+    def guardar_fondo(self, fondo_data: Dict) -> Dict:
+        """Guarda un nuevo fondo o actualiza uno existente."""
+        guardados = self.guardar_fondos([fondo_data])
+        return guardados[0] if guardados else {}
     
     def eliminar_fondo(self, fondo_id: int) -> bool:
         """Elimina un fondo por su ID."""
@@ -60,6 +129,7 @@ class DatabaseManager:
                 .delete()\
                 .eq("id", fondo_id)\
                 .execute()
+            _invalidar_caches()
             return True
         except Exception as e:
             print(f"Error al eliminar fondo: {e}")
@@ -68,31 +138,28 @@ class DatabaseManager:
     def obtener_acciones(self) -> List[Dict]:
         """Obtiene todas las acciones de la base de datos."""
         try:
-            response = self.client.table("acciones").select("*").execute()
-            return response.data
+            return _leer_acciones()
         except Exception as e:
             print(f"Error al obtener acciones: {e}")
             return []
     
-    def guardar_accion(self, accion_data: Dict) -> Dict:
-        """Guarda una nueva acción o actualiza una existente."""
+    def guardar_acciones(self, acciones: List[Dict]) -> List[Dict]:
+        """Guarda varias acciones en una sola petición mediante upsert."""
         try:
-            if "id" in accion_data and accion_data["id"]:
-                # Actualizar acción existente
-                response = self.client.table("acciones")\
-                    .update(accion_data)\
-                    .eq("id", accion_data["id"])\
-                    .execute()
-            else:
-                # Crear nueva acción
-                response = self.client.table("acciones")\
-                    .insert(accion_data)\
-                    .execute()
-            
-            return response.data[0] if response.data else {}
+            response = self.client.table("acciones")\
+                .upsert(acciones, on_conflict="id")\
+                .execute()
+
+            _invalidar_caches()
+            return response.data or []
         except Exception as e:
-            print(f"Error al guardar acción: {e}")
-            return {}
+            print(f"Error al guardar acciones: {e}")
+            return []
+
+    def guardar_accion(self, accion_data: Dict) -> Dict:
+        """Guarda una nueva acción o actualiza una existente."""
+        guardadas = self.guardar_acciones([accion_data])
+        return guardadas[0] if guardadas else {}
     
     def eliminar_accion(self, accion_id: int) -> bool:
         """Elimina una acción por su ID."""
@@ -101,23 +168,52 @@ class DatabaseManager:
                 .delete()\
                 .eq("id", accion_id)\
                 .execute()
+            _invalidar_caches()
             return True
         except Exception as e:
             print(f"Error al eliminar acción: {e}")
             return False
     
+    async def _load_all(self) -> Tuple[List[Dict], List[Dict]]:
+        """Lee fondos y acciones en paralelo con el cliente asíncrono."""
+        cliente = await acreate_client(self.url, self.key)
+        try:
+            respuesta_fondos, respuesta_acciones = await asyncio.gather(
+                cliente.table("fondos").select(FONDO_COLS).execute(),
+                cliente.table("acciones").select(ACCION_COLS).execute()
+            )
+            return respuesta_fondos.data, respuesta_acciones.data
+        finally:
+            # El cliente asíncrono se crea por llamada: cerrarlo evita dejar
+            # conexiones httpx abiertas en cada lectura
+            await cliente.postgrest.aclose()
+
+    def obtener_todo(self) -> Tuple[List[Dict], List[Dict]]:
+        """
+        Obtiene fondos y acciones de una vez, solapando ambas esperas.
+
+        Las dos consultas son independientes, así que asyncio.gather las
+        lanza en paralelo y la carga conjunta cuesta un solo viaje en lugar
+        de dos secuenciales.
+
+        Returns:
+            Tuple: (lista de fondos, lista de acciones)
+        """
+        try:
+            return asyncio.run(self._load_all())
+        except Exception as e:
+            print(f"Error al obtener la cartera completa: {e}")
+            return [], []
+
     def crear_tablas_iniciales(self) -> None:
         """Crea las tablas iniciales si no existen."""
         # Esta función asume que las tablas ya están creadas en Supabase
         # En un entorno real, se ejecutarían migraciones SQL
         pass
 
-# Instancia global de DatabaseManager
-db_manager = None
-
+# Instancia global de DatabaseManager: st.cache_resource la mantiene viva
+# entre reruns y sesiones de Streamlit, conservando el pool de conexiones
+@st.cache_resource(show_spinner=False)
 def obtener_db_manager() -> DatabaseManager:
     """Obtiene la instancia global de DatabaseManager."""
-    global db_manager
-    if db_manager is None:
-        db_manager = DatabaseManager()
-    return db_manager
+    return DatabaseManager()
@@ -4,10 +4,33 @@ Incluye obtención de datos en tiempo real de Yahoo Finance.
 """
 
 import yfinance as yf
+import numpy as np
 import pandas as pd
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
 from typing import Dict, List, Tuple, Optional
 import streamlit as st
+from mercado_module import obtener_cierres_ytd
+
+# Mapa de campo interno a cabecera de la tabla: define de una vez el orden y
+# los nombres de las columnas que se muestran en la página de fondos
+COLUMN_MAP_FONDOS = {
+    'id': 'ID',
+    'nombre': 'Nombre del fondo',
+    'ticker': 'Ticker',
+    'tipo_inversion': 'Tipo de inversión',
+    'valor_compra': 'Valor de compra',
+    'cantidad': 'Cantidad invertida',
+    'valor_actual': 'Valor actual',
+    'cambio_diario_eur': 'Cambio diario (€)',
+    'cambio_diario_pct': 'Cambio diario (%)',
+    'cambio_ytd_pct': 'Cambio YTD (%)',
+    'ganancia_total_eur': 'Ganancias/pérdidas totales (€)',
+    'ganancia_total_pct': 'Ganancias/pérdidas totales (%)',
+    'fecha_compra': 'Fecha de compra',
+    'total_invertido': 'Total invertido',
+    'valor_actual_total': 'Valor actual total'
+}
 
 class FondoManager:
     """Gestor de operaciones relacionadas con fondos de inversión."""
@@ -16,7 +39,88 @@ class FondoManager:
         """Inicializa el gestor de fondos."""
         self.db = db_manager
         self.cache = {}
-    
+
+    def _prefetch_mercado(self, tickers: List[str]) -> None:
+        """
+        Descarga en una sola llamada los históricos YTD de varios fondos.
+
+        Usa yf.download con group_by='ticker' para sustituir las N peticiones
+        secuenciales (.info + .history por fondo) por una única descarga con
+        abanico de hilos; los resultados se guardan en self.cache para que
+        calcular_metricas_fondo los reutilice.
+
+        Args:
+            tickers: Lista de símbolos de Yahoo Finance
+        """
+        pendientes = [t for t in tickers if t not in self.cache]
+        if not pendientes:
+            return
+
+        try:
+            hoy = datetime.now()
+            inicio_ano = datetime(hoy.year, 1, 1)
+            # Descarga compartida y cacheada: si el módulo de acciones ya
+            # pidió este lote en la ventana de caché, no se repite el viaje
+            cierres = obtener_cierres_ytd(
+                tuple(sorted(pendientes)),
+                inicio_ano.strftime('%Y-%m-%d'),
+                hoy.strftime('%Y-%m-%d')
+            )
+
+            if cierres.empty:
+                return
+
+            # Rellenar huecos de cotización antes de operar
+            cierres = cierres.ffill()
+
+            precio_actual = cierres.iloc[-1]
+            precio_cierre_anterior = cierres.iloc[-2] if len(cierres) > 1 else precio_actual
+            precio_inicio_ano = cierres.bfill().iloc[0]
+
+            cambio_diario_eur = (precio_actual - precio_cierre_anterior).round(2)
+            cambio_diario_pct = ((precio_actual - precio_cierre_anterior) / precio_cierre_anterior * 100).round(2)
+            cambio_ytd_pct = ((precio_actual - precio_inicio_ano) / precio_inicio_ano * 100).round(2)
+            valor_actual = precio_actual.round(2)
+
+            # Los nombres salen de la caché diaria; en frío se resuelven en
+            # paralelo en lugar de una petición .info secuencial por fondo
+            nombres = self._nombres(tuple(sorted(pendientes)))
+
+            for ticker in pendientes:
+                if ticker not in valor_actual.index or pd.isna(valor_actual[ticker]):
+                    continue
+
+                self.cache[ticker] = {
+                    'nombre': nombres.get(ticker, ticker),
+                    'ticker': ticker,
+                    'valor_actual': valor_actual[ticker],
+                    'cambio_diario_eur': cambio_diario_eur[ticker],
+                    'cambio_diario_pct': cambio_diario_pct[ticker],
+                    'cambio_ytd_pct': cambio_ytd_pct[ticker]
+                }
+        except Exception as e:
+            print(f"Error en la descarga por lotes de {len(pendientes)} fondos: {e}")
+
+    @st.cache_data(ttl=86400)  # 24 horas, igual que los nombres individuales
+    def _nombres(_self, tickers: Tuple[str, ...]) -> Dict[str, str]:
+        """
+        Obtiene en paralelo los nombres largos de varios tickers.
+
+        Las consultas a .info son de E/S pura, así que el abanico de hilos
+        las solapa y el lote completo cuesta aproximadamente un viaje.
+        """
+        with ThreadPoolExecutor(max_workers=16) as executor:
+            return dict(zip(tickers, executor.map(_self._nombre, tickers)))
+
+    @st.cache_data(ttl=86400)  # 24 horas: el nombre del fondo no cambia
+    def _nombre(_self, ticker: str) -> str:
+        """Obtiene el nombre largo de un fondo, cacheado un día entero."""
+        try:
+            return yf.Ticker(ticker).info.get('longName', ticker)
+        except Exception as e:
+            print(f"Error al obtener el nombre de {ticker}: {e}")
+            return ticker
+
     @st.cache_data(ttl=300)  # Cache de 5 minutos
     def obtener_datos_mercado(_self, ticker: str) -> Optional[Dict]:
         """
@@ -29,29 +133,22 @@ class FondoManager:
             Diccionario con datos de mercado o None si hay error
         """
         try:
-            fondo = yf.Ticker(ticker)
-            
-            # Obtener información básica
-            info = fondo.info
-            
             # Obtener datos históricos para YTD
             hoy = datetime.now()
             inicio_ano = datetime(hoy.year, 1, 1)
-            historico = fondo.history(start=inicio_ano.strftime('%Y-%m-%d'), 
-                                     end=hoy.strftime('%Y-%m-%d'))
+            historico = yf.Ticker(ticker).history(start=inicio_ano.strftime('%Y-%m-%d'),
+                                                  end=hoy.strftime('%Y-%m-%d'))
             
             if historico.empty:
                 return None
             
-            # Calcular cambios
-            precio_actual = info.get('regularMarketPrice', 
-                                   info.get('currentPrice', 
-                                          historico['Close'].iloc[-1] if not historico.empty else 0))
-            
-            precio_cierre_anterior = info.get('regularMarketPreviousClose', 
-                                            historico['Close'].iloc[-2] if len(historico) > 1 else precio_actual)
-            
-            precio_inicio_ano = historico['Close'].iloc[0] if not historico.empty else precio_actual
+            # Los tres precios de referencia salen del propio histórico:
+            # consultar .info por ellos costaba otra petición HTTP por ticker
+            # y cada refresco
+            cierres = historico['Close'].to_numpy()
+            precio_actual = float(cierres[-1])
+            precio_cierre_anterior = float(cierres[-2]) if cierres.size > 1 else precio_actual
+            precio_inicio_ano = float(cierres[0])
             
             cambio_diario_pct = ((precio_actual - precio_cierre_anterior) / precio_cierre_anterior * 100) 
             cambio_diario_eur = precio_actual - precio_cierre_anterior
@@ -59,7 +156,7 @@ class FondoManager:
             cambio_ytd_pct = ((precio_actual - precio_inicio_ano) / precio_inicio_ano * 100) 
             
             return {
-                'nombre': info.get('longName', ticker),
+                'nombre': _self._nombre(ticker),
                 'ticker': ticker,
                 'valor_actual': round(precio_actual, 2),
                 'cambio_diario_eur': round(cambio_diario_eur, 2),
@@ -82,7 +179,10 @@ class FondoManager:
             Diccionario con todas las métricas calculadas
         """
         try:
-            datos_mercado = self.obtener_datos_mercado(fondo_data['ticker'])
+            # Primero la caché rellenada por la descarga en lote; la petición
+            # individual queda como respaldo para tickers que fallaran en ella
+            datos_mercado = self.cache.get(fondo_data['ticker']) \
+                or self.obtener_datos_mercado(fondo_data['ticker'])
             
             if not datos_mercado:
                 # Usar valores por defecto si no se pueden obtener datos
@@ -124,28 +224,72 @@ class FondoManager:
         Returns:
             Tuple: (lista de fondos, diccionario de totales)
         """
-        fondos_db = self.db.obtener_fondos()
-        fondos_calculados = []
-        
-        total_invertido = 0
-        valor_actual_total = 0
-        ganancia_total_eur = 0
-        
-        for fondo in fondos_db:
-            fondo_con_metricas = self.calcular_metricas_fondo(fondo)
-            fondos_calculados.append(fondo_con_metricas)
-            
-            # Acumular totales
-            total_invertido += fondo_con_metricas.get('total_invertido', 0)
-            valor_actual_total += fondo_con_metricas.get('valor_actual_total', 0)
-            ganancia_total_eur += fondo_con_metricas.get('ganancia_total_eur', 0)
-        
+        # El DataFrame ya llega tipado desde la capa de base de datos, así
+        # que la aritmética vectorizada trabaja sobre columnas contiguas sin
+        # conversiones por registro
+        df = self.db.obtener_fondos_df()
+
+        if df.empty:
+            return [], {
+                'total_invertido': 0,
+                'valor_actual_total': 0,
+                'ganancia_total_eur': 0,
+                'ganancia_total_pct': 0
+            }
+
+        # Una sola descarga por lotes en lugar de una petición por fondo
+        tickers = df['ticker'] if 'ticker' in df.columns else pd.Series(dtype=object)
+        tickers_unicos = list(dict.fromkeys(t for t in tickers if t))
+        if tickers_unicos:
+            self._prefetch_mercado(tickers_unicos)
+
+        # Los datos de mercado se incorporan como columnas y la aritmética de
+        # métricas se hace una vez por columna en C, no fondo a fondo en Python
+        datos_mercado = [
+            self.cache.get(t) or self.obtener_datos_mercado(t) or {}
+            for t in tickers
+        ]
+
+        df_mercado = pd.DataFrame(datos_mercado, index=df.index)
+        for col in ('valor_actual', 'cambio_diario_eur', 'cambio_diario_pct', 'cambio_ytd_pct'):
+            if col not in df_mercado.columns:
+                df_mercado[col] = np.nan
+
+        # El nombre de Yahoo prevalece cuando llegó; si no, el de la BD
+        if 'nombre' in df_mercado.columns:
+            df['nombre'] = df_mercado['nombre'].fillna(df['nombre'])
+
+        valor_compra = pd.to_numeric(df['valor_compra'], errors='coerce').fillna(0)
+        cantidad = pd.to_numeric(df['cantidad'], errors='coerce').fillna(0)
+
+        df['valor_actual'] = pd.to_numeric(df_mercado['valor_actual'], errors='coerce').fillna(0)
+        df['cambio_diario_eur'] = df_mercado['cambio_diario_eur'].fillna(0)
+        df['cambio_diario_pct'] = df_mercado['cambio_diario_pct'].fillna(0)
+        df['cambio_ytd_pct'] = df_mercado['cambio_ytd_pct'].fillna(0)
+
+        df['ganancia_total_eur'] = ((df['valor_actual'] - valor_compra) * cantidad).round(2)
+        # where(> 0) deja NaN donde no hay valor de compra y evita la
+        # división entre cero; el fillna posterior lo convierte en 0
+        df['ganancia_total_pct'] = ((df['valor_actual'] - valor_compra)
+                                    / valor_compra.where(valor_compra > 0) * 100).round(2).fillna(0)
+        df['total_invertido'] = (valor_compra * cantidad).round(2)
+        df['valor_actual_total'] = (df['valor_actual'] * cantidad).round(2)
+
+        # Solo al final se vuelve a la lista de diccionarios que espera la UI
+        fondos_calculados = df.to_dict('records')
+
+        # Totales como una única reducción en C sobre las columnas ya
+        # calculadas, en lugar de acumular fila a fila en Python
+        sumas = df[['total_invertido', 'valor_actual_total', 'ganancia_total_eur']].sum()
+        total_invertido = float(sumas['total_invertido'])
+        ganancia_total_eur = float(sumas['ganancia_total_eur'])
+
         # Calcular porcentaje total de ganancia
         ganancia_total_pct = (ganancia_total_eur / total_invertido * 100) if total_invertido > 0 else 0
-        
+
         totales = {
             'total_invertido': round(total_invertido, 2),
-            'valor_actual_total': round(valor_actual_total, 2),
+            'valor_actual_total': round(float(sumas['valor_actual_total']), 2),
             'ganancia_total_eur': round(ganancia_total_eur, 2),
             'ganancia_total_pct': round(ganancia_total_pct, 2)
         }
@@ -165,54 +309,25 @@ class FondoManager:
         """
         if not fondos:
             return pd.DataFrame()
+
+        # Construir el DataFrame de una vez desde los registros y renombrar
+        # las columnas, en lugar de montar un dict de Python por fila
+        df = pd.DataFrame.from_records(fondos) \
+            .reindex(columns=list(COLUMN_MAP_FONDOS)) \
+            .rename(columns=COLUMN_MAP_FONDOS)
         
-        # Crear lista de filas para el DataFrame
-        filas = []
-        
-        for fondo in fondos:
-            fila = {
-                'ID': fondo.get('id', ''),
-                'Nombre del fondo': fondo.get('nombre', ''),
-                'Ticker': fondo.get('ticker', ''),
-                'Tipo de inversión': fondo.get('tipo_inversion', ''),
-                'Valor de compra': fondo.get('valor_compra', 0),
-                'Cantidad invertida': fondo.get('cantidad', 0),
-                'Valor actual': fondo.get('valor_actual', 0),
-                'Cambio diario (€)': fondo.get('cambio_diario_eur', 0),
-                'Cambio diario (%)': fondo.get('cambio_diario_pct', 0),
-                'Cambio YTD (%)': fondo.get('cambio_ytd_pct', 0),
-                'Ganancias/pérdidas totales (€)': fondo.get('ganancia_total_eur', 0),
-                'Ganancias/pérdidas totales (%)': fondo.get('ganancia_total_pct', 0),
-                'Fecha de compra': fondo.get('fecha_compra', ''),
-                'Total invertido': fondo.get('total_invertido', 0),
-                'Valor actual total': fondo.get('valor_actual_total', 0)
-            }
-            filas.append(fila)
-        
-        # Crear DataFrame
-        df = pd.DataFrame(filas)
-        
-        # Añadir fila de totales
-        if not df.empty:
-            fila_totales = {
-                'Nombre del fondo': '**TOTALES**',
-                'Ticker': '',
-                'Tipo de inversión': '',
-                'Valor de compra': '',
-                'Cantidad invertida': '',
-                'Valor actual': '',
-                'Cambio diario (€)': '',
-                'Cambio diario (%)': '',
-                'Cambio YTD (%)': '',
-                'Ganancias/pérdidas totales (€)': totales['ganancia_total_eur'],
-                'Ganancias/pérdidas totales (%)': totales['ganancia_total_pct'],
-                'Fecha de compra': '',
-                'Total invertido': totales['total_invertido'],
-                'Valor actual total': totales['valor_actual_total']
-            }
-            
-            # Crear un DataFrame para la fila de totales y concatenar
-            df_totales = pd.DataFrame([fila_totales])
-            df = pd.concat([df, df_totales], ignore_index=True)
-        
+        # Añadir fila de totales sin pasar por pd.concat (que copia el
+        # DataFrame completo). Solo las columnas de texto reciben cadenas
+        # vacías: las numéricas quedan en NaN para no degradar su dtype
+        df.loc[len(df)] = {
+            'Nombre del fondo': '**TOTALES**',
+            'Ticker': '',
+            'Tipo de inversión': '',
+            'Fecha de compra': '',
+            'Ganancias/pérdidas totales (€)': totales['ganancia_total_eur'],
+            'Ganancias/pérdidas totales (%)': totales['ganancia_total_pct'],
+            'Total invertido': totales['total_invertido'],
+            'Valor actual total': totales['valor_actual_total']
+        }
+
         return df
@@ -0,0 +1,81 @@
+"""
+Módulo compartido de descarga de históricos de mercado.
+Una sola descarga por lotes de Yahoo Finance sirve a fondos y acciones,
+deduplicando peticiones cuando ambos gestores comparten tickers o cuando
+varios llamantes coinciden en el mismo rerun.
+"""
+
+import threading
+import time
+from datetime import date, datetime
+
+import yfinance as yf
+import pandas as pd
+
+def _mercado_abierto() -> bool:
+    """
+    Comprueba de forma barata si hay mercado operando ahora mismo.
+
+    Ventana aproximada de lunes a viernes entre las 09:00 (apertura de BME)
+    y las 22:00 (cierre de NYSE) en hora local; no contempla festivos, pero
+    basta para distinguir las horas en que las cotizaciones pueden moverse.
+    """
+    ahora = datetime.now()
+    return ahora.weekday() < 5 and 9 <= ahora.hour < 22
+
+# Caché manual en lugar de st.cache_data: el TTL depende del estado del
+# mercado (5 minutos abierto, 12 horas cerrado) y la clave incluye el día y
+# el estado para que el primer rerun tras la reapertura refresque
+_cierres_cache = {}
+_cierres_lock = threading.Lock()
+
+def obtener_cierres_ytd(tickers: tuple, inicio: str, fin: str) -> pd.DataFrame:
+    """
+    Descarga los cierres YTD de varios tickers en una sola llamada.
+
+    La clave de caché es la tupla ordenada de tickers más las fechas, así
+    que cualquier módulo que pida el mismo lote dentro del TTL reutiliza la
+    descarga en lugar de repetirla. Con el mercado cerrado (noches y fines
+    de semana) el histórico es inmutable y el TTL sube a 12 horas.
+
+    Args:
+        tickers: Tupla ordenada de símbolos de Yahoo Finance
+        inicio: Fecha de inicio en formato ISO
+        fin: Fecha de fin en formato ISO
+
+    Returns:
+        DataFrame con una columna de cierres por ticker (vacío si falla)
+    """
+    abierto = _mercado_abierto()
+    ttl = 300 if abierto else 43200
+    clave = (tickers, inicio, fin, date.today().isoformat(), abierto)
+
+    with _cierres_lock:
+        entrada = _cierres_cache.get(clave)
+    if entrada is not None and time.time() - entrada[0] < ttl:
+        return entrada[1]
+
+    cierres = _descargar_cierres(tickers, inicio, fin)
+
+    with _cierres_lock:
+        _cierres_cache[clave] = (time.time(), cierres)
+    return cierres
+
+def _descargar_cierres(tickers: tuple, inicio: str, fin: str) -> pd.DataFrame:
+    """Lanza la descarga por lotes y extrae la columna de cierres."""
+    historico = yf.download(
+        tickers=" ".join(tickers),
+        start=inicio,
+        end=fin,
+        group_by='ticker',
+        threads=True,
+        progress=False
+    )
+
+    if historico.empty:
+        return pd.DataFrame()
+
+    # Una columna de cierres por ticker
+    if len(tickers) > 1:
+        return historico.xs('Close', axis=1, level=1)
+    return historico[['Close']].rename(columns={'Close': tickers[0]})